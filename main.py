@@ -5,9 +5,11 @@ from typing import List, Dict
 from collections import defaultdict
 
 import scripts.dataCollect as dc
-from scripts.agreement import get_scores_and_delta, keep_by_annotation_count
+from scripts.agreement import agreement_table, set_agreement_table, keep_by_annotation_count
 from scripts.helper import define_expert, pearson_correlation
 from scripts.helper import define_category, process_rationale
+from scripts.rationaleIndex import build_index
+from scripts.transitions import categorised_posts, transition_tensor, phase_frequencies, overlap_counts
 import scripts.utils as u
 
 
@@ -32,18 +34,19 @@ example = data[['Question ID', 'User', 'gender_1']].sample(10)
 print(example)
 
 # ANALYSIS 1.1: Inter-annotator agreement scores and delta between phases
+# table columns: Ph1, Ph2, ... and $\Delta$ between the first and last phase (other pairs as '1->2')
+PHASE_COLUMNS = {p: f'Ph{p}' for p in dc.PHASES} | {f'{dc.PHASES[0]}->{dc.PHASES[-1]}': '$\Delta$'}
+
 def analyse_IAA(df: pd.DataFrame, score: str, order_by: Dict[str, pd.DataFrame] = None):
     """ Compute a dictionary with tables of scores of binary categories and generic questions """
-    table_1, values, table_1_cols = {}, defaultdict(dict), ['Ph1', 'Ph2', '$\Delta$']
+    table_1, labels = {}, {}
     # from gender and sexuality binary categories
     for g in dc.TARGET_GROUPS:
-        for sg in dc.TARGET_LABELS[g]:
-            values[g][sg] = get_scores_and_delta(df, score, sg)
-        table_1[g] = pd.DataFrame.from_dict(values[g], orient='index', columns=table_1_cols)
+        labels[g] = dc.TARGET_LABELS[g]
     # from the other data annotations
-    for label in [f"{l}_bin" for l in dc.TARGET_GROUPS + dc.HATE_QS]:
-        values['other'][label] = get_scores_and_delta(df, score, label)
-    table_1['other'] = pd.DataFrame.from_dict(values['other'], orient='index', columns=table_1_cols)
+    labels['other'] = [f"{l}_bin" for l in dc.TARGET_GROUPS + dc.HATE_QS]
+    for t, t_labels in labels.items():
+        table_1[t] = agreement_table(df, score, t_labels).rename(columns=PHASE_COLUMNS)
     # sort values by custom list or by delta
     for t in table_1.keys():
         if order_by and t in order_by.keys():
@@ -68,6 +71,9 @@ for key, table in table_1_alpha.items():
                   formatters={"name": str.upper},
                   float_format="{:.3f}".format))
 
+# Set-valued Krippendorff's Alpha on target group label lists (MASI distance)
+with open('results/1_agreement/krippendorff_masi.tex', 'w') as f:
+    f.write(set_agreement_table(data, metric='masi').rename(columns=PHASE_COLUMNS).to_latex(float_format="{:.3f}".format))
 
 # Fleiss Kappa scores keeping only those with 6 annotations
 d_filter = keep_by_annotation_count(df=data, by='Question ID', n_counts=6) 
@@ -97,18 +103,10 @@ def analyse_types(df: pd.DataFrame, group: str, by_order: List[str], samples: pd
 
     if export_plots:
         for g in dc.TARGET_GROUPS:
-            # Plot distribution
-            u.export_frequency_plot(df=samples, 
-                                col1=f"{g}_types_{group}_1", 
-                                col2=f"{g}_types_{group}_2", 
-                                order=by_order, 
-                                labels_type=g, 
-                                pdf_filename=f'results/3_categorisation/types_freq-plot_{g}_{group}.pdf')
-
             # Plot shifts
             u.export_sankey_diagram(df=samples, 
-                                col1=f"{g}_types_{group}_1", 
-                                col2=f"{g}_types_{group}_2", 
+                                col1=f"{g}_types_{group}_{dc.PHASES[0]}", 
+                                col2=f"{g}_types_{group}_{dc.PHASES[-1]}", 
                                 order=by_order[::-1], 
                                 labels_type=g, 
                                 pdf_filename=f'results/3_categorisation/types_shifts-sankey_{g}_{group}.pdf', 
@@ -129,14 +127,22 @@ for group in data[dc.CATEG['c1']].unique():
     analyse_types(df=subset, group=group, by_order=types_hs)
 
 samples.to_csv('results/samples.csv', index=False)
+# Categories of every post and transitions between the first and last phase (group x target x from x to)
+posts = categorised_posts(samples)
+tensor = transition_tensor(posts, order=types_hs)
+# Justification terms indexed once for both target groups
+rationale_index = build_index(data)
 for g in dc.TARGET_GROUPS:
-    # Categories overlap between c1 groups
+    # Plot distribution
+    freq_first, freq_last = phase_frequencies(tensor, 'all', g)
+    u.plot_frequencies(freq_first, freq_last, order=types_hs, labels_type=g, pdf_filename=f'results/3_categorisation/types_freq-plot_{g}_all.pdf')
+    # Categories overlap between c1 groups
     for p in dc.PHASES:
-        u.export_overlap_count(samples, col1=f"{g}_types_LGBT_{p}", col2=f"{g}_types_nonLGBT_{p}", order=types_hs[::-1], labels_type=g, pdf_filename=f'results/3_categorisation/types_overlap_{g}_Phase{p}.pdf')
+        u.plot_overlap(overlap_counts(posts, g, p, order=types_hs[::-1]), labels_type=g, pdf_filename=f'results/3_categorisation/types_overlap_{g}_Phase{p}.pdf')
     # Entitites learnt
     with open(f'results/3_categorisation/types_learned_{g}', 'w') as output_file:
         sys.stdout = output_file
-        process_rationale(samples, data, labels_type=g)
+        process_rationale(samples, data, labels_type=g, index=rationale_index, posts=posts)
         sys.stdout = sys.__stdout__
 
     
@@ -146,19 +152,16 @@ for g in dc.TARGET_GROUPS:
 
 # ANALYSIS 2: Disaggregated IAA scores and correlation with target groups
 def subgroup_analysis(df: pd.DataFrame, iaa_score: str, annotator_categories: List[int], labels: List[str], labels_type: str, order_by: pd.DataFrame = None):
-    """ Compute a list of dataframes: with IAA and correlation on each phase """
+    """ Compute a dict of dataframes: with IAA (alpha_{p}) and correlation (r_{p}) on each phase """
     values = defaultdict(dict)
     for c in annotator_categories:
         print(df[c].value_counts())
         # agreement on each subgroup
         for sc in df[c].unique():
             # for every value in the category
-            subset, alphas_1, alphas_2 = df.loc[df[c] == sc], [], []
-            for sg in labels:
-                alpha_1, alpha_2, _ = get_scores_and_delta(subset, iaa_score, sg)
-                alphas_1.append(alpha_1)
-                alphas_2.append(alpha_2)
-            values['alpha_1'][sc], values['alpha_2'][sc] = alphas_1, alphas_2
+            alphas = agreement_table(df.loc[df[c] == sc], iaa_score, labels)
+            for p in dc.PHASES:
+                values[f'alpha_{p}'][sc] = alphas[p].to_list()
         # alignment with highest target group in category c
         for p in dc.PHASES:
             for i, sg in enumerate(labels):
@@ -175,12 +178,12 @@ def subgroup_analysis(df: pd.DataFrame, iaa_score: str, annotator_categories: Li
                     except KeyError:
                         values[f'r_{p}'][src] = [corr_coeff]
 
-    # index names and sort by (6 tables: alpha and R for each phase)
-    res_df =  [pd.DataFrame.from_dict(values[k]) for k in values.keys()]
-    for i in range(0, len(res_df)):
-        res_df[i].index = labels
+    # index names and sort by (alpha and R for each phase)
+    res_df = {k: pd.DataFrame.from_dict(values[k]) for k in values.keys()}
+    for k in res_df.keys():
+        res_df[k].index = labels
         if isinstance(order_by, pd.DataFrame):
-            res_df[i] = res_df[i].reindex(order_by.index.to_list())
+            res_df[k] = res_df[k].reindex(order_by.index.to_list())
 
     return res_df
 
@@ -194,7 +197,8 @@ show_plot = {**show_plot, **{'other': [f"{l}_bin" for l in dc.TARGET_GROUPS + dc
 for g, g_labels in show_plot.items():
     # of annotator demographics
     results = subgroup_analysis(data, 'krippendorf', dc.CATEG.values(), labels = g_labels, labels_type=g, order_by=table_1_alpha[g])
-    table_2[f'{g}_alpha_1'], table_2[f'{g}_alpha_2'], table_2[f'{g}_r_1'], table_2[f'{g}_r_2'] = results
+    for k, res in results.items():
+        table_2[f'{g}_{k}'] = res
 
     # Table plots
     cols = ['M', 'W', 'S', 'G']
@@ -1,8 +1,13 @@
+from itertools import combinations
+from collections import defaultdict
+from typing import List
 import numpy as np 
 import pandas as pd
 from statsmodels.stats.inter_rater import fleiss_kappa, aggregate_raters
 import krippendorff
 
+from scripts.dataCollect import PHASES, TARGET_GROUPS
+
 
 #########################
 # Inter-annotator agreement (IAA)/Interrater reliability
@@ -63,14 +68,134 @@ def krippendorf(df: pd.DataFrame, rater_col: str, subject_col: str, rating_col:
 
 
 def get_scores_and_delta(data_subset: pd.DataFrame, score: str, rating_col: str, rater_col: str = 'User', subject_col: str = 'Question ID', verbose: bool = False):
-    """ Fleiss or Krippendorff values in both phases and delta between them """
-
-    # get alpha values
-    if score == 'krippendorf':
-        val_1 = krippendorf(df=data_subset, rater_col=rater_col, subject_col=subject_col, rating_col=f'{rating_col}_1', verbose=verbose)
-        val_2 = krippendorf(df=data_subset, rater_col=rater_col, subject_col=subject_col, rating_col=f'{rating_col}_2', verbose=verbose)
-    # get kappa values
-    elif score == 'fleiss':
-        val_1 = fleiss(df=data_subset, subject_col=subject_col, rating_col=f'{rating_col}_1', verbose=verbose)
-        val_2 = fleiss(df=data_subset, subject_col=subject_col, rating_col=f'{rating_col}_2', verbose=verbose)
-    return [round(val_1, 3), round(val_2, 3), round(val_2-val_1, 3)]
\ No newline at end of file
+    """ Fleiss or Krippendorff values in each phase and delta between the first and last """
+    values = []
+    for p in PHASES:
+        # get alpha values
+        if score == 'krippendorf':
+            values.append(krippendorf(df=data_subset, rater_col=rater_col, subject_col=subject_col, rating_col=f'{rating_col}_{p}', verbose=verbose))
+        # get kappa values
+        elif score == 'fleiss':
+            values.append(fleiss(df=data_subset, subject_col=subject_col, rating_col=f'{rating_col}_{p}', verbose=verbose))
+    return [round(val, 3) for val in values] + [round(values[-1]-values[0], 3)]
+
+
+def phase_ratings(df: pd.DataFrame, labels: List[str], rater_col: str = 'User', subject_col: str = 'Question ID') -> pd.DataFrame:
+    """ Single rater x (label, phase, subject) table of the {label}_{p} columns """
+    cols = {f'{l}_{p}': (l, p) for l in labels for p in PHASES}
+    ratings = df.set_index([rater_col, subject_col])[list(cols)]
+    # keep the first rating, as pivot_table(aggfunc="first")
+    ratings = ratings.loc[~ratings.index.duplicated()]
+    ratings.columns = pd.MultiIndex.from_tuples(cols.values(), names=['label', 'phase'])
+    # lexsorted columns, so selecting (label, phase) does not take the slow path
+    return ratings.unstack(subject_col).sort_index(axis=1)
+
+
+def phase_deltas(table: pd.DataFrame) -> pd.DataFrame:
+    """ Add the difference between every pair of phase columns (e.g. '1->2'), all pairs at once """
+    pairs = list(combinations(PHASES, 2))
+    later, earlier = table[[b for _, b in pairs]].values, table[[a for a, _ in pairs]].values
+    deltas = pd.DataFrame(later - earlier, index=table.index, columns=[f'{a}->{b}' for a, b in pairs])
+    return pd.concat([table, deltas], axis=1)
+
+
+def agreement_table(df: pd.DataFrame, score: str, labels: List[str], rater_col: str = 'User', subject_col: str = 'Question ID') -> pd.DataFrame:
+    """ Fleiss or Krippendorff values of labels (rows) in each phase (columns) and pairwise deltas, from one pivot """
+    ratings = phase_ratings(df, labels, rater_col, subject_col)
+    values = defaultdict(dict)
+    for l in labels:
+        for p in PHASES:
+            # rater x subject
+            matrix = ratings[(l, p)].values.astype(float)
+            if score == 'krippendorf':
+                level = 'ordinal' if '_bin' in l else 'nominal'
+                values[p][l] = krippendorff.alpha(reliability_data=matrix, level_of_measurement=level)
+            elif score == 'fleiss':
+                category_assignment = [subject[~np.isnan(subject)] for subject in matrix.T]
+                table, _ = aggregate_raters(data=[s for s in category_assignment if len(s)])
+                values[p][l] = fleiss_kappa(table)
+    return phase_deltas(pd.DataFrame(values, index=labels, columns=PHASES)).round(3)
+
+
+def coincidence_alpha(o: np.ndarray, level: str = 'nominal'):
+    """ Krippendorff's Alpha from a coincidence matrix (values sorted along both axes), or a stack of them (..., V, V) """
+    # Same computation as krippendorff.alpha, but starting from already aggregated coincidences
+    n_v = o.sum(axis=-2)
+    n = n_v.sum(axis=-1)[..., np.newaxis, np.newaxis]
+    e = (n_v[..., :, np.newaxis] * n_v[..., np.newaxis, :] - n_v[..., np.newaxis, :] * np.eye(n_v.shape[-1])) / (n - 1)
+    if level == 'ordinal':
+        # squared sum of pairable values between two ranks (minus half of each end)
+        i = np.arange(n_v.shape[-1])
+        lo, hi = np.minimum.outer(i, i), np.maximum.outer(i, i)
+        cum = np.concatenate([np.zeros(n_v.shape[:-1] + (1,)), np.cumsum(n_v, axis=-1)], axis=-1)
+        d = (cum[..., hi + 1] - cum[..., lo] - (n_v[..., lo] + n_v[..., hi]) / 2) ** 2
+    else:
+        d = 1 - np.eye(n_v.shape[-1])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        alpha = 1 - (o * d).sum(axis=(-2, -1)) / (e * d).sum(axis=(-2, -1))
+    # undefined with less than two values
+    return np.where(np.count_nonzero(n_v, axis=-1) < 2, np.nan, alpha)[()]
+
+
+#########################
+# Set-valued agreement (target group label lists)
+#########################
+
+def set_distance(a: frozenset, b: frozenset, metric: str = 'masi') -> float:
+    """ Jaccard or MASI (Passonneau, 2006) distance between two label sets """
+    if a == b:
+        return 0.0
+    jaccard = len(a & b) / len(a | b)
+    if metric == 'jaccard':
+        return 1 - jaccard
+    # monotonicity: subset, some overlap, or disjoint
+    if a <= b or b <= a:
+        m = 2 / 3
+    elif a & b:
+        m = 1 / 3
+    else:
+        m = 0
+    return 1 - jaccard * m
+
+
+def label_sets(values: pd.Series) -> pd.Series:
+    """ Label lists as frozensets, also from the joined strings of the compact fact table (e.g. 'men, women') """
+    if isinstance(values.dtype, pd.CategoricalDtype) or values.map(type).eq(str).all():
+        return values.astype(str).apply(lambda x: frozenset(x.split(', ') if x else []))
+    if not values.map(lambda x: isinstance(x, (list, tuple, set, frozenset))).all():
+        raise TypeError(f'{values.name}: expected label lists or joined strings of labels')
+    return values.apply(frozenset)
+
+
+def set_alpha(df: pd.DataFrame, rating_col: str, rater_col: str = 'User', subject_col: str = 'Question ID', metric: str = 'masi', 
+              sets: pd.Index = None, distances: np.ndarray = None) -> float:
+    """ Krippendorff's Alpha of a column of label lists, with distances between the distinct sets (sets, distances if given) """
+    df = df.drop_duplicates(subset=[rater_col, subject_col])
+    values = label_sets(df[rating_col])
+    if sets is None:
+        sets = pd.Index(values.unique())
+        distances = np.array([[set_distance(a, b, metric) for b in sets] for a in sets])
+    # subject x distinct set counts
+    subjects, s = np.unique(df[subject_col].values, return_inverse=True)
+    counts = np.zeros((len(subjects), len(sets)))
+    np.add.at(counts, (s, sets.get_indexer(values)), 1)
+    # coincidences summed over subjects: C' diag(1/(m-1)) C - diag(...)
+    m = counts.sum(axis=1, keepdims=True)
+    weighted = np.divide(counts, m - 1, out=np.zeros_like(counts), where=m > 1)
+    o = weighted.T @ counts - np.diagflat(weighted.sum(axis=0))
+    n_v = o.sum(axis=0)
+    e = (np.outer(n_v, n_v) - np.diagflat(n_v)) / (n_v.sum() - 1)
+    return 1 - (o * distances).sum() / (e * distances).sum()
+
+
+def set_agreement_table(df: pd.DataFrame, metric: str = 'masi', rater_col: str = 'User', subject_col: str = 'Question ID') -> pd.DataFrame:
+    """ Set-valued Krippendorff's Alpha of the {g}_cat_{p} label lists (rows g) in each phase and pairwise deltas """
+    values = {p: {} for p in PHASES}
+    for g in TARGET_GROUPS:
+        cols = [f'{g}_cat_{p}' for p in PHASES]
+        # distinct label sets in any phase, and their distances, computed once
+        sets = pd.Index(pd.unique(pd.concat([label_sets(df[c]) for c in cols])))
+        distances = np.array([[set_distance(a, b, metric) for b in sets] for a in sets])
+        for p, c in zip(PHASES, cols):
+            values[p][g] = set_alpha(df, c, rater_col, subject_col, metric, sets, distances)
+    return phase_deltas(pd.DataFrame(values, index=TARGET_GROUPS, columns=PHASES)).round(3)
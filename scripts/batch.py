@@ -0,0 +1,98 @@
+import os, argparse
+from itertools import combinations
+from typing import List, Dict
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+import pandas as pd
+
+import scripts.dataCollect as dc
+from scripts.dataCollect import ALL
+from scripts.agreement import agreement_table, set_agreement_table
+from scripts.sharedData import publish_hateRep, attach_hateRep
+
+
+#########################
+# Batch of studies (many annotators/ and data/ folders) on one process pool
+#########################
+
+def load_study(u_path: str, d_path: str, out_path: str) -> Dict:
+    """ Load a study, publish its compact tables in out_path/dataset and return what its analysis tasks need """
+    facts, posts, annotators = dc.load_hateRep(u_path=u_path, d_path=d_path, compact=True, feedback=False)
+    publish_hateRep(facts, posts, annotators, os.path.join(out_path, 'dataset'))
+    labels = {g: list(dc.TARGET_LABELS[g]) for g in dc.TARGET_GROUPS}
+    labels['other'] = [f"{l}_bin" for l in dc.TARGET_GROUPS + dc.HATE_QS]
+    subsets = [ALL] + [(c, sc) for c in dc.CATEG.values() for sc in facts[c].unique()]
+    return {'phases': list(dc.PHASES), 'labels': labels, 'subsets': subsets}
+
+
+def agreement_task(out_path: str, phases: List[str], labels: Dict[str, List[str]], subset: tuple) -> pd.DataFrame:
+    """ Krippendorff's Alpha tables (and set-valued MASI alpha) of a study on a subset of annotators """
+    # phases of this study (the worker may have run other studies before)
+    dc.PHASES[:] = phases
+    facts, posts, annotators = attach_hateRep(os.path.join(out_path, 'dataset'))
+    c, sc = subset
+    if subset != ALL:
+        facts = facts.loc[facts[c] == sc]
+    tables = {t: agreement_table(facts, 'krippendorf', t_labels) for t, t_labels in labels.items()}
+    cat_cols = [f'{g}_cat_{p}' for g in dc.TARGET_GROUPS for p in phases]
+    tables['masi'] = set_agreement_table(dc.expand_hateRep(facts, posts, annotators, columns=cat_cols), metric='masi')
+    return pd.concat(tables, names=['table', 'label'])
+
+
+def run_batch(studies: pd.DataFrame, out_path: str, workers: int = None) -> pd.DataFrame:
+    """ Load and analyse studies (rows: study, u_path, d_path, out_path) on a shared pool; returns and writes all tables """
+    results, failed, phases, labels = [], [], {}, {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # analysis tasks of a study are queued as soon as it is loaded, so idle workers pick up whatever is ready
+        pending = {pool.submit(load_study, s.u_path, s.d_path, s.out_path): (s, None) for s in studies.itertuples()}
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                s, subset = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    failed.append((s.study, subset, repr(e)))
+                    print(f'... {s.study} {subset or "load"} failed: {e!r}')
+                    continue
+                if subset is None:
+                    print(f'... loaded {s.study}: {len(result["subsets"])} subsets')
+                    phases[s.study], labels[s.study] = result['phases'], result['labels']
+                    for sub in result['subsets']:
+                        task = pool.submit(agreement_task, s.out_path, result['phases'], result['labels'], sub)
+                        pending[task] = (s, sub)
+                else:
+                    results.append(pd.concat({(s.study, *subset): result}, names=['study', 'category', 'subset']))
+
+    # Consolidated tables across studies
+    os.makedirs(out_path, exist_ok=True)
+    table = pd.concat(results).sort_index() if results else pd.DataFrame()
+    table.to_csv(os.path.join(out_path, 'agreement_studies.csv'))
+    if failed:
+        pd.DataFrame(failed, columns=['study', 'subset', 'error']).to_csv(os.path.join(out_path, 'failed.csv'), index=False)
+    if results:
+        for study, study_table in table.xs(ALL, level=['category', 'subset']).groupby(level='study'):
+            s, p = studies.loc[studies.study == study].iloc[0], phases[study]
+            # same columns as main.py: Ph1, Ph2, ... and $\Delta$ between the first and last phase
+            columns = {ph: f'Ph{ph}' for ph in p} | {f'{p[0]}->{p[-1]}': '$\\Delta$'}
+            os.makedirs(os.path.join(s.out_path, '1_agreement'), exist_ok=True)
+            for key, t in study_table.droplevel('study').groupby(level='table'):
+                t = t.droplevel('table').rename_axis(None)[p + [f'{a}->{b}' for a, b in combinations(p, 2)]]
+                if key in labels[study]:
+                    # rows as analyse_IAA in main.py: labels order, sorted by delta (first to last phase)
+                    t = t.reindex(labels[study][key]).sort_values(by=f'{p[0]}->{p[-1]}')
+                else:
+                    t = t.reindex(dc.TARGET_GROUPS)
+                t = t.rename(columns=columns)
+                with open(os.path.join(s.out_path, '1_agreement', f'krippendorff_{key}.tex'), 'w') as f:
+                    f.write(t.to_latex(float_format="{:.3f}".format))
+    return table
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Agreement analyses of many studies on a shared process pool')
+    parser.add_argument('studies', help='CSV with columns study, u_path, d_path, out_path')
+    parser.add_argument('--out', default='results/batch', help='folder of the consolidated tables')
+    parser.add_argument('--workers', type=int, default=None, help='pool size (default: number of CPUs)')
+    args = parser.parse_args()
+
+    run_batch(pd.read_csv(args.studies), out_path=args.out, workers=args.workers)
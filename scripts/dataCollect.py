@@ -1,10 +1,12 @@
-import glob, ast
-from datetime import datetime
+import os, glob, ast
 from typing import List
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
 
 # Dataset features
 CATEG = {'c1': 'group', 'c2': 'subgroupA', 'c3': 'subgroupB'}
+# Subset (category, subgroup) with every annotator
+ALL = ('all', 'all')
 
 # Experiment setup
 PHASES = ['1', '2']
@@ -16,46 +18,68 @@ TARGET_GROUPS = ['gender', 'sexuality']
 # individual binary encodings
 TARGET_LABELS = {}
 
-def import_users(u_path: str):
+# Columns of the Prolific exports read as text. Left to inference: 'Time taken' and 'Age' (numbers or codes such as
+# 'DATA_EXPIRED') and 'Participant id' (numbers in this release, hex strings in Prolific)
+PROLIFIC_DTYPES = {c: str for c in ['Submission id', 'Status', 'Started at', 'Completed at', 'Reviewed at', 'Archived at', 'Completion code',
+                                    'Total approvals', 'Sexual orientation', 'Cisgender and transgender', 'Gender', 'Lgbtq+', 'Sex',
+                                    'Ethnicity simplified', 'Country of birth', 'Country of residence', 'Nationality', 'Language',
+                                    'Student status', 'Employment status']}
+# Column types of the survey users table ('User' inferred as 'Participant id') and its free-text feedback columns (optional)
+QUESTIONS_DTYPES = {c: 'int64' for c in ['Consent', 'Stage', 'Live']}
+FEEDBACK_COLUMNS = ['Feedback - Phase One', 'Feedback - Phase Two', 'Gender Terms Why', 'Sexuality Terms Why']
+TIME_FORMAT = "%d/%m/%Y %H:%M"
+
+def import_prolific(f: str) -> pd.DataFrame:
+    """ Import the approved submissions of a Prolific table """
+    u = pd.read_csv(f, keep_default_na=False, dtype=PROLIFIC_DTYPES)
+    # include only approved submissions (e.g. others are 'ACTIVE', 'REJECTED', 'RETURNED', 'TIMED-OUT')
+    u = u.loc[u.Status == 'APPROVED'].copy()
+    # numbers once other submissions are dropped (codes of approved ones as NaN)
+    u['Total approvals'] = pd.to_numeric(u['Total approvals'], errors='coerce')
+    return u
+
+
+def import_users(u_path: str, workers: int = None):
     """ Import Prolific tables from (hateRep/annotators) folder """
 
-    # Import prolific tables using info from phase 1 
-    f_users, users = glob.glob(f'{u_path}/*p1_prolific*'), []
-    for f in f_users:
-        u = pd.read_csv(f, keep_default_na=False)
-        # include only approved submissions (e.g. others are 'ACTIVE', 'REJECTED', 'RETURNED', 'TIMED-OUT')
-        u = u.loc[u.Status.isin(['APPROVED'])] 
-        # add group and subgroup categories
-        fname = f.split('/')[-1]
-        for i, tag in enumerate(CATEG.values()):
-            u[tag] = fname.split('_')[i] 
-        users.append(u)
+    # Import prolific tables using info from phase 1 (read in parallel threads)
+    f_users = glob.glob(f'{u_path}/*p1_prolific*')
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        users = list(pool.map(import_prolific, f_users))
+    # add group and subgroup categories (from file names, e.g. LGBT_G_NB_p1_prolific_export...)
+    tags = pd.Series([os.path.basename(f) for f in f_users]).str.split('_', expand=True).iloc[:, :len(CATEG)]
+    tags.columns = list(CATEG.values())
+    tags = tags.loc[tags.index.repeat([len(u) for u in users])].reset_index(drop=True)
     users = pd.concat(users, ignore_index=True)
+    users[tags.columns] = tags
     users.rename(columns={'Participant id': 'User'}, inplace=True) 
     
     return users
 
 
-def import_survey(d_path: str):
+def import_survey(d_path: str, feedback: bool = True):
     """ Import data samples, data annotations, and user questions table from (hateRep/data) folder """
 
     # Annotations
     annot = [pd.read_csv(f, keep_default_na=False) for f in glob.glob(f'{d_path}/annotations*')]
     annot = pd.concat(annot, ignore_index=True)
+    # phases in the study (e.g. without and with semantics)
+    PHASES[:] = [str(p) for p in sorted(annot['Phase'].unique())]
     annot[HATE_QS] = annot[HATE_QS].replace(to_replace=HATE_LABELS)
 
-    # Data samples
+    # Data samples
     samples = pd.read_csv(f'{d_path}/database.csv')
     samples['box_entity'] = samples['box_entity'].apply(lambda x: ast.literal_eval(x))
     samples['context'] = samples['box_entity'].apply(lambda x: ', '.join(x))
 
-    # User additional info
-    questions = pd.read_csv(d_path + '/users.csv', keep_default_na=False)
+    # User additional info (without free-text feedback unless needed)
+    usecols = None if feedback else (lambda c: c not in FEEDBACK_COLUMNS)
+    questions = pd.read_csv(d_path + '/users.csv', keep_default_na=False, dtype=QUESTIONS_DTYPES, usecols=usecols)
     questions.rename(columns={'Consent Time': 'Phase 1 Started'}, inplace=True)
     # time to complete each phase
     for p in PHASES:
         for t in ['Started', 'Finished']:
-           questions[f'Phase {p} {t}'] = questions[f'Phase {p} {t}'].apply(lambda x: datetime.strptime(x, "%d/%m/%Y %H:%M")) 
+           questions[f'Phase {p} {t}'] = pd.to_datetime(questions[f'Phase {p} {t}'], format=TIME_FORMAT)
         questions[f'Complete_{p}'] = questions[f'Phase {p} Finished'] - questions[f'Phase {p} Started'] 
 
     return samples, annot, questions
@@ -100,23 +124,12 @@ def excOuterJoin(reasons1: str, reasons2: str, verbose: bool = False) -> List[st
 
 
 
-def load_hateRep(u_path: str, d_path: str):
-
-    # Prolific data
-    users = import_users(u_path)
-
-    # Survey data
-    samples, annot, questions = import_survey(d_path)
-
-
-    # ... one-hot encodings of user info
-    questions['Personal Experience'] = questions['Personal Experience'].apply(lambda labels: str(labels).split(','))
-    questions, _ = one_hot_encoding(questions, 'Personal Experience')
-    # ... one-hot encodings of annotations
+def encode_annotations(annot: pd.DataFrame) -> pd.DataFrame:
+    """ Add label lists ({g}_cat), decisions ({g}) and scale encodings (_bin) to annotation rows """
     for g in TARGET_GROUPS:
         c_no, c_yes = f'{g.capitalize()} Unclear/Not-Referring', f'About {g}?'
         # unclear/not referring
-        annot[c_no].replace(to_replace={'not-referring': f'{g}_not-referring', 'unclear': f'{g}_unclear'}, inplace=True)
+        annot[c_no] = annot[c_no].replace(to_replace={'not-referring': f'{g}_not-referring', 'unclear': f'{g}_unclear'})
         annot[c_no] = annot[c_no].apply(lambda x: [] if x == '' else [x])
         # target group labels
         annot[c_yes] = annot[c_yes].apply(lambda labels: [f'{g}_other' if l == 'other' else l for l in str(labels).split(', ')]
@@ -124,32 +137,121 @@ def load_hateRep(u_path: str, d_path: str):
         # annot[f'{g}_bin'] = annot[c_yes].apply(lambda labels: 0 if not labels else 1)
         annot[g] = annot.apply(lambda x: 'referring' if x[c_yes] else x[c_no][0].split('_')[-1], axis=1)
         annot[f'{g}_bin'] = annot[g].apply(lambda label: scale_encoding(label, ['not-referring', 'unclear', 'referring']))
-        # individual binary encodings
         annot[f'{g}_cat'] = annot.apply(lambda x: x[c_yes] + x[c_no], axis=1)
+    # other labels:
+    for hate_q in HATE_QS:
+        annot[f'{hate_q}_bin'] = annot[hate_q].apply(lambda label: scale_encoding(label, ['not-hateful', 'unclear', 'hateful']))
+    return annot
+
+
+def merge_phases(annot: pd.DataFrame, keys: List[str] = ['User', 'Question ID', 'Question']) -> pd.DataFrame:
+    """ One row per user and post annotated in every phase, with annotation columns suffixed by phase (_1, _2, ...) """
+    annot = annot.drop_duplicates(subset=keys + ['Phase'])
+    annot = annot.loc[annot.groupby(keys)['Phase'].transform('nunique') == len(PHASES)]
+    # single pivot with a phase axis (instead of merging phases pairwise)
+    phase = annot['Phase'].astype(str).rename('phase')
+    wide = annot.set_index(keys + [phase]).unstack('phase')
+    wide = wide[[(c, p) for p in PHASES for c in annot.columns if c not in keys]]
+    wide.columns = [f'{c}_{p}' for c, p in wide.columns]
+    # rows in the order of the first phase
+    order = annot.loc[phase == PHASES[0], keys]
+    return wide.reindex(pd.MultiIndex.from_frame(order)).reset_index()
+
+
+def load_hateRep(u_path: str, d_path: str, compact: bool = False, feedback: bool = True):
+
+    # Prolific data
+    users = import_users(u_path)
+
+    # Survey data
+    samples, annot, questions = import_survey(d_path, feedback=feedback)
+
+
+    # ... one-hot encodings of user info
+    experience = questions['Personal Experience'].astype(str)
+    questions['Personal Experience'] = experience.str.split(',')
+    dummies = experience.str.get_dummies(sep=',')
+    questions[dummies.columns] = dummies
+    # ... one-hot encodings of annotations
+    annot = encode_annotations(annot)
+    for g in TARGET_GROUPS:
+        # individual binary encodings
         annot, TARGET_LABELS[g] = one_hot_encoding(annot, f'{g}_cat')
     # rename transgender column
     annot.rename(columns={'yes': 'transgender'}, inplace=True)
     TARGET_LABELS['gender'] = ['transgender' if x == 'yes' else x for x in TARGET_LABELS['gender']]
-    # other labels:
-    for hate_q in HATE_QS:
-        annot[f'{hate_q}_bin'] = annot[hate_q].apply(lambda label: scale_encoding(label, ['not-hateful', 'unclear', 'hateful']))
 
 
     # ... keep unique user table with relevant info
     users = pd.merge(users, questions, on='User', how='inner')
 
     # merge by phases 
-    annot = pd.merge(annot.loc[annot.Phase==1], annot.loc[annot.Phase==2], on=['User', 'Question ID', 'Question'], how='inner', suffixes=['_1', '_2'])
+    annot = merge_phases(annot)
     annot = pd.merge(samples.drop(columns=['Question']), annot, on=['Question ID'], how='inner')
+    first, last = PHASES[0], PHASES[-1]
     for g in TARGET_GROUPS:
-        # change in justifications across phase
-        annot[f'justify_change_{g}'] = annot.apply(lambda x: ', '.join(excOuterJoin(x[f'Justify {g.capitalize()}_1'], x[f'Justify {g.capitalize()}_2'])), axis=1)
+        # change in justifications across phase (first to last)
+        annot[f'justify_change_{g}'] = annot.apply(lambda x: ', '.join(excOuterJoin(x[f'Justify {g.capitalize()}_{first}'], x[f'Justify {g.capitalize()}_{last}'])), axis=1)
     
     # Final dataset
     data = pd.merge(annot, users, on='User', how='inner')
 
+    if compact:
+        return compact_hateRep(data, samples, users)
     return data, samples, users
 
+
+def list_columns(columns: List[str]) -> List[str]:
+    """ Columns holding lists of labels (e.g. {g}_cat_{p}) """
+    prefixes = [f'{g}_cat' for g in TARGET_GROUPS] + [f'About {g}?' for g in TARGET_GROUPS] + \
+        [f'{g.capitalize()} Unclear/Not-Referring' for g in TARGET_GROUPS]
+    return [c for c in columns if c.rsplit('_', 1)[0] in prefixes]
+
+
+def compact_hateRep(data: pd.DataFrame, samples: pd.DataFrame, users: pd.DataFrame):
+    """ Split the merged dataset into a fact table of coded annotations and post (samples) and annotator (users) tables """
+    # post and user columns are kept once in their own table (with the post text shown to annotators)
+    posts = samples.drop(columns=['Question'])
+    posts = pd.merge(posts, data[['Question ID', 'Question']].drop_duplicates('Question ID'), on='Question ID', how='inner')
+    annotators = users.copy()
+    dim_cols = [c for c in posts.columns if c != 'Question ID'] + \
+        [c for c in annotators.columns if c not in ['User'] + list(CATEG.values())]
+    facts = data.drop(columns=dim_cols)
+
+    # label lists as interned strings, e.g. ['men', 'women'] -> 'men, women'
+    for c in list_columns(facts.columns):
+        facts[c] = facts[c].apply(', '.join)
+    for c in facts.columns:
+        if facts[c].dtype == 'int64':
+            facts[c] = pd.to_numeric(facts[c], downcast='integer')
+        elif facts[c].dtype == 'float64':
+            facts[c] = pd.to_numeric(facts[c], downcast='float')
+        elif facts[c].dtype == 'object' and facts[c].nunique() < len(facts) / 2:
+            facts[c] = facts[c].astype('category')
+    for c in CATEG.values():
+        annotators[c] = annotators[c].astype('category')
+
+    return facts, posts, annotators
+
+
+def expand_hateRep(facts: pd.DataFrame, posts: pd.DataFrame, annotators: pd.DataFrame, columns: List[str] = None) -> pd.DataFrame:
+    """ Join the compact tables back into the layout of load_hateRep (only with columns, if given) """
+    keys = ['Question ID', 'User']
+    if columns is None:
+        columns = facts.columns.to_list() + posts.columns.to_list() + annotators.columns.to_list()
+    fact_cols = [c for c in facts.columns if c in keys or c in columns]
+    post_cols = [c for c in posts.columns if c in columns and c not in fact_cols]
+    user_cols = [c for c in annotators.columns if c in columns and c not in fact_cols + post_cols]
+
+    df = facts[fact_cols].copy()
+    for c in list_columns(df.columns):
+        df[c] = df[c].astype(str).apply(lambda x: x.split(', ') if x else [])
+    if post_cols:
+        df = pd.merge(df, posts[['Question ID'] + post_cols], on='Question ID', how='left')
+    if user_cols:
+        df = pd.merge(df, annotators[['User'] + user_cols], on='User', how='left')
+    return df
+
     
 
 
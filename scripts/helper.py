@@ -2,6 +2,10 @@ from typing import List, Dict
 import pandas as pd
 from scipy import stats
 
+from scripts.dataCollect import PHASES, CATEG
+from scripts.rationaleIndex import build_index, new_terms, term_frequencies
+from scripts.transitions import categorised_posts, flips
+
 #########################
 # Alignment
 #########################
@@ -41,7 +45,7 @@ def pearson_correlation(src_df: pd.DataFrame, target_df: pd.DataFrame, label: st
 #########################
 # Categorisation
 #########################
-def group_by_value(input_data: List[List[str]]):
+def group_by_value(input_data: List[List[str]], verbose: bool = True):
     """ Create annotation vectors: dictionaries of count and sublists of unique values """
     group_dict = {}
     for sublist in input_data:
@@ -55,7 +59,8 @@ def group_by_value(input_data: List[List[str]]):
     group = [sublists for _, sublists in sorted_groups]
     # Extract the group counts
     counts = [len(sublists) for _, sublists in sorted_groups]
-    print(f'{counts} counts of groups: {group}')
+    if verbose:
+        print(f'{counts} counts of groups: {group}')
     return group, counts
 
 
@@ -67,11 +72,12 @@ def is_majority(same: int, total: int):
         return False
 
 
-def define_category(subset_annot: pd.DataFrame, col: str, labels_type: str) -> str:
+def define_category(subset_annot: pd.DataFrame, col: str, labels_type: str, verbose: bool = True) -> str:
     """ Rule-based categorisation by agreement and decision on target groups """
     annotations = subset_annot[col].to_list()
-    print(len(annotations), annotations)
-    subgroup_annots, subgroup_counts = group_by_value(annotations)
+    if verbose:
+        print(len(annotations), annotations)
+    subgroup_annots, subgroup_counts = group_by_value(annotations, verbose)
     first_group = subgroup_annots[0]
     # Case 1: all are the same
     if subgroup_counts[0] == len(annotations):
@@ -106,32 +112,26 @@ def define_category(subset_annot: pd.DataFrame, col: str, labels_type: str) -> s
     # Case 4: no agreement
     else:
         category='no-agreement'
-    print(category)
+    if verbose:
+        print(category)
     return category
 
 
-def process_rationale(d: pd.DataFrame, annot: pd.DataFrame, labels_type: str):
+def process_rationale(d: pd.DataFrame, annot: pd.DataFrame, labels_type: str, index: pd.DataFrame = None, posts: pd.DataFrame = None):
     """ Print counts and unique entities learnt with semantics in participant groups """
-    N, agreed = d.shape[0],  ['all', 'majority', 'opinions']
-    yes = [f'{a}_targeting' for a in agreed]
-    no = [f'{a}_not-targeting' for a in agreed] # + [f'{a}_unclear' for a in agreed] + ['no-agreement']
-    replace = {k:'no' for k in no} | {k:'yes' for k in yes}
-    replace_c = [f'{labels_type}_types_{sg}_{p}' for sg in ['LGBT', 'nonLGBT'] for p in ['1', '2']]
-    d[replace_c] = d[replace_c].replace(to_replace=replace)
+    N = d.shape[0]
+    first, last = PHASES[0], PHASES[-1]
+    if posts is None:
+        posts = categorised_posts(d)
+    # terms in justifications of the last phase not used by the same user on the post in the first one
+    if index is None:
+        index = build_index(annot)
+    learned = new_terms(index, labels_type, first, last)
     for sg in ['LGBT', 'nonLGBT']:
         print(f'\n\n\n PROCESSING {labels_type} for {sg}')
-        # Get IDs of new posts targeting 
-        ids = d.loc[(d[f'{labels_type}_types_{sg}_1']=='no') & (d[f'{labels_type}_types_{sg}_2']=='yes'), 'Question ID'].to_list()
-        # Filter rationales in texts(new in justify_change_{labels_type}), full in justify)
-        subset = annot.loc[annot['Question ID'].isin(ids)]
+        # Get IDs of new posts targeting 
+        ids = flips(posts, sg, labels_type, from_decision='not-targeting', to_decision='targeting', first=first, last=last)
         print(f'{sg}: {round(len(ids)/N*100, 2)}% ({len(ids)})')
-        for id in ids:
-            print('\n\nQUESTION ID: ', id)
-            subset_id = subset.loc[subset['Question ID']==id]
-            print(subset_id['Question'].to_list()[0])
-            print(f'\n {sg}:')
-            print(subset_id.loc[subset_id['group']==sg, [f'{labels_type}_cat_2', f'justify_change_{labels_type}', f'Justify {labels_type.capitalize()}_2']])
-
-            other_sg = ['LGBT' if sg == 'nonLGBT' else 'nonLGBT'][0]
-            print(f'\n by {other_sg}')
-            print(subset_id.loc[subset_id['group']==other_sg, [f'{labels_type}_cat_2', f'justify_change_{labels_type}', f'Justify {labels_type.capitalize()}_2']])            
\ No newline at end of file
+        # Frequency of new terms on these posts (annotations by each group)
+        freq = term_frequencies(learned.loc[learned['Question ID'].isin(ids)], by=[CATEG['c1']])
+        print(freq.to_string())
@@ -0,0 +1,174 @@
+import pickle, argparse
+from collections import Counter
+from typing import List, Dict, Union
+import numpy as np
+import pandas as pd
+import krippendorff
+
+import scripts.dataCollect as dc
+from scripts.dataCollect import ALL
+from scripts.agreement import coincidence_alpha
+
+
+#########################
+# Online inter-annotator agreement
+#########################
+
+class AgreementTracker:
+    """ Krippendorff's Alpha of phases, labels and annotator subgroups, updated one batch of annotations at a time
+
+    Keeps the value counts of every (subset, phase, Question ID) unit and the coincidences they add up to, so a batch
+    only revisits the units it touches. Binary labels store (o_11, o_01) and the count of pairable values; o_00 is
+    whatever is left, so labels first seen in a late batch are zero for every earlier annotation.
+    """
+
+    def __init__(self, users: pd.DataFrame = None):
+        # User -> annotator subsets, e.g. [('all', 'all'), ('group', 'LGBT'), ('subgroupA', 'S'), ...]
+        self.subsets = None
+        if users is not None:
+            self.update_users(users)
+        self.labels = {g: set() for g in dc.TARGET_GROUPS}
+        self.seen = set()
+        self.units = {}
+        self.coincidences = {}
+
+    def update_users(self, users: pd.DataFrame):
+        """ Add annotators (users table with CATEG columns); records of unknown users are skipped, as in load_hateRep """
+        if self.subsets is None:
+            self.subsets = {}
+        for _, row in users.iterrows():
+            self.subsets[row['User']] = [ALL] + [(c, row[c]) for c in dc.CATEG.values()]
+
+    def update(self, records: Union[pd.DataFrame, List[Dict]]) -> int:
+        """ Count a batch of annotation rows (annotations_*.csv schema) and return how many were new """
+        batch = pd.DataFrame(records).fillna('')
+        batch[dc.HATE_QS] = batch[dc.HATE_QS].replace(to_replace=dc.HATE_LABELS)
+        batch = dc.encode_annotations(batch)
+
+        added = 0
+        for _, row in batch.iterrows():
+            user, p, id = row['User'], str(row['Phase']), row['Question ID']
+            if (p, user, id) in self.seen:
+                # keep the first annotation, as pivot_table(aggfunc="first")
+                continue
+            if self.subsets is not None and user not in self.subsets:
+                continue
+            self.seen.add((p, user, id))
+            added += 1
+            for subset in (self.subsets[user] if self.subsets is not None else [ALL]):
+                self._add_value(subset, p, id, row)
+        return added
+
+    def _add_value(self, subset: tuple, p: str, id: int, row: pd.Series):
+        """ Replace the contribution of a unit to the coincidences after adding one annotation """
+        unit = self.units.setdefault((subset, p, id), {'m': 0, 'binary': Counter(), 'ordinal': {}})
+        stats = self.coincidences.setdefault((subset, p), {'pairable': 0.0, 'binary': {}, 'ordinal': {}})
+
+        self._contribution(unit, stats, sign=-1)
+        unit['m'] += 1
+        for g in dc.TARGET_GROUPS:
+            self.labels[g].update(row[f'{g}_cat'])
+            unit['binary'].update(set(row[f'{g}_cat']))
+        for label in [f"{l}_bin" for l in dc.TARGET_GROUPS + dc.HATE_QS]:
+            # missing answers (e.g. an empty scale question) are not values, as in the krippendorf pivot
+            if pd.notna(row[label]):
+                unit['ordinal'].setdefault(label, Counter())[row[label]] += 1
+        self._contribution(unit, stats, sign=1)
+
+    @staticmethod
+    def _contribution(unit: dict, stats: dict, sign: int):
+        """ Add (sign=1) or remove (sign=-1) the coincidences of a unit """
+        m = unit['m']
+        if m > 1:
+            stats['pairable'] += sign * m
+            for label, ones in unit['binary'].items():
+                o = stats['binary'].setdefault(label, [0.0, 0.0])
+                o[0] += sign * ones * (ones - 1) / (m - 1)
+                o[1] += sign * ones * (m - ones) / (m - 1)
+        for label, counts in unit['ordinal'].items():
+            m_l = sum(counts.values())
+            if m_l < 2:
+                continue
+            o = stats['ordinal'].setdefault(label, {})
+            for c, n_c in counts.items():
+                for k, n_k in counts.items():
+                    o[(c, k)] = o.get((c, k), 0.0) + sign * n_c * (n_k - (c == k)) / (m_l - 1)
+
+    def alpha(self, label: str, p: str, subset: tuple = ALL) -> float:
+        """ Current Krippendorff's Alpha of a label (one-hot target label or _bin column) in phase p """
+        stats = self.coincidences.get((subset, p))
+        if stats is None:
+            return np.nan
+        if label.endswith('_bin'):
+            o = stats['ordinal'].get(label, {})
+            domain = sorted({c for c, _ in o})
+            o = np.array([[o.get((c, k), 0.0) for k in domain] for c in domain]).reshape(len(domain), len(domain))
+            return coincidence_alpha(o, level='ordinal')
+        o_11, o_01 = stats['binary'].get(label, [0.0, 0.0])
+        o_00 = stats['pairable'] - o_11 - 2 * o_01
+        return coincidence_alpha(np.array([[o_00, o_01], [o_01, o_11]]), level='nominal')
+
+    @property
+    def phases(self) -> List[str]:
+        """ Phases seen in the stream, in numeric order (dc.PHASES is only set by import_survey) """
+        return sorted({p for _, p in self.coincidences}, key=float)
+
+    def scores(self, subset: tuple = ALL) -> Dict[str, pd.DataFrame]:
+        """ Tables of Ph1, Ph2, ... and delta (first to last phase) by label, in the layout of analyse_IAA in main.py """
+        phases = self.phases
+        tables, cols = {}, [f'Ph{p}' for p in phases] + [r'$\Delta$']
+        rows = {g: sorted(self.labels[g]) for g in dc.TARGET_GROUPS}
+        rows['other'] = [f"{l}_bin" for l in dc.TARGET_GROUPS + dc.HATE_QS]
+        for t, labels in rows.items():
+            values = {}
+            for label in labels:
+                vals = [self.alpha(label, p, subset) for p in phases]
+                values['transgender' if label == 'yes' else label] = [round(v, 3) for v in vals] + [round(vals[-1]-vals[0], 3)]
+            tables[t] = pd.DataFrame.from_dict(values, orient='index', columns=cols)
+        return tables
+
+    def save(self, path: str):
+        """ Checkpoint the counts to disk """
+        with open(path, 'wb') as f:
+            pickle.dump(self.__dict__, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def load(cls, path: str):
+        """ Restore a tracker from a checkpoint written by save """
+        tracker = cls()
+        with open(path, 'rb') as f:
+            tracker.__dict__.update(pickle.load(f))
+        return tracker
+
+
+def check_tracker(d_path: str, missing: float = 0.05, seed: int = 0) -> pd.DataFrame:
+    """ Tracker vs krippendorff.alpha of the _bin labels in each phase, on annotations with a fraction of answers blanked """
+    _, annot, _ = dc.import_survey(d_path)
+    annot = annot.copy()
+    rng = np.random.default_rng(seed)
+    for q in dc.HATE_QS:
+        annot.loc[rng.random(len(annot)) < missing, q] = ''
+    tracker = AgreementTracker()
+    tracker.update(annot)
+
+    # same rows, first annotation of each user and post in a phase
+    encoded = dc.encode_annotations(annot.copy()).drop_duplicates(subset=['Phase', 'User', 'Question ID'])
+    rows = []
+    for label in [f"{l}_bin" for l in dc.TARGET_GROUPS + dc.HATE_QS]:
+        for p in tracker.phases:
+            matrix = encoded.loc[encoded['Phase'].astype(str) == p].pivot(index='User', columns='Question ID', values=label)
+            expected = krippendorff.alpha(reliability_data=matrix.values.astype(float), level_of_measurement='ordinal')
+            rows.append((label, p, tracker.alpha(label, p), expected))
+    return pd.DataFrame(rows, columns=['label', 'phase', 'tracker', 'krippendorff'])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Check the online tracker against krippendorff.alpha with missing answers')
+    parser.add_argument('--d_path', default='data')
+    parser.add_argument('--missing', type=float, default=0.05, help='fraction of blanked answers of each hate speech question')
+    args = parser.parse_args()
+
+    check = check_tracker(args.d_path, missing=args.missing)
+    print(check.to_string())
+    assert np.allclose(check['tracker'], check['krippendorff']), 'Tracker differs from krippendorff.alpha'
+    print('Tracker matches krippendorff.alpha')
@@ -0,0 +1,55 @@
+from typing import List
+import pandas as pd
+
+import scripts.dataCollect as dc
+
+
+#########################
+# Inverted index of justifications (stemmed tokens)
+#########################
+
+def build_index(data: pd.DataFrame) -> pd.DataFrame:
+    """ Postings (target, term) -> (Question ID, User, phase, group, subgroups) from the Justify {G}_{p} columns """
+    from whoosh.analysis import StemmingAnalyzer
+    stemmer = StemmingAnalyzer(stoplist=None)
+
+    keys = ['Question ID', 'User'] + list(dc.CATEG.values())
+    postings = []
+    for g in dc.TARGET_GROUPS:
+        for p in dc.PHASES:
+            col = f'Justify {g.capitalize()}_{p}'
+            # tokenize each distinct text once
+            texts = data[col].astype(str)
+            tokens = {text: sorted({token.text for token in stemmer(text)}) for text in texts.unique()}
+            p_postings = data[keys].assign(target=g, phase=p, term=texts.map(tokens)).explode('term')
+            postings.append(p_postings.dropna(subset=['term']))
+    index = pd.concat(postings, ignore_index=True)
+    for c in ['target', 'phase', 'term'] + list(dc.CATEG.values()):
+        index[c] = index[c].astype('category')
+    return index.set_index(['target', 'term']).sort_index()
+
+
+def lookup(index: pd.DataFrame, target: str, terms: List[str]) -> pd.DataFrame:
+    """ Postings of (stemmed) terms justifying target annotations """
+    found = [t for t in terms if (target, t) in index.index]
+    return index.loc[[(target, t) for t in found]].reset_index()
+
+
+def new_terms(index: pd.DataFrame, target: str, first: str = None, last: str = None) -> pd.DataFrame:
+    """ Postings of terms a user justified a post with in the last phase but not in the first one """
+    first, last = first or dc.PHASES[0], last or dc.PHASES[-1]
+    postings = index.loc[target].reset_index()
+    postings['phase'] = postings['phase'].astype(str)
+    keys = ['term', 'Question ID', 'User']
+    before = postings.loc[postings['phase'] == first, keys]
+    after = postings.loc[postings['phase'] == last]
+    after = pd.merge(after, before, on=keys, how='left', indicator=True)
+    return after.loc[after['_merge'] == 'left_only'].drop(columns='_merge').reset_index(drop=True)
+
+
+def term_frequencies(postings: pd.DataFrame, by: List[str] = [dc.CATEG['c1'], 'phase']) -> pd.DataFrame:
+    """ Term x (by) table with the number of annotations (user and post) using each term """
+    if 'term' not in postings.columns:
+        postings = postings.reset_index()
+    counts = postings.groupby(['term'] + by, observed=True).size().unstack(by, fill_value=0)
+    return counts.loc[counts.sum(axis=1).sort_values(ascending=False, kind='stable').index]
@@ -0,0 +1,67 @@
+from typing import List
+import numpy as np
+import pandas as pd
+
+from scripts.dataCollect import PHASES
+from scripts.agreement import phase_ratings, coincidence_alpha
+
+
+#########################
+# Annotator reliability
+#########################
+
+def value_counts(ratings: np.ndarray, domain: np.ndarray) -> np.ndarray:
+    """ One-hot rater x subject x value tensor of a rating table (np.nan when missing) """
+    return (ratings[..., np.newaxis] == domain).astype(float)
+
+
+def coincidences(counts: np.ndarray) -> np.ndarray:
+    """ Coincidence matrix (..., V, V) of each row of value counts (..., V), zero for less than two values """
+    m = counts.sum(axis=-1)[..., np.newaxis, np.newaxis]
+    pairs = counts[..., :, np.newaxis] * counts[..., np.newaxis, :] - counts[..., np.newaxis, :] * np.eye(counts.shape[-1])
+    return np.divide(pairs, m - 1, out=np.zeros_like(pairs), where=m > 1)
+
+
+def loo_reliability(ratings: np.ndarray, level: str = 'nominal') -> pd.DataFrame:
+    """ Agreement of each rater (rows of ratings) with the leave-one-out majority and its alpha contribution """
+    domain = np.unique(ratings[~np.isnan(ratings)])
+    one_hot = value_counts(ratings, domain)
+    counts = one_hot.sum(axis=0)
+    rated = ~np.isnan(ratings)
+
+    # majority of the other raters of each subject (ties count as agreement)
+    others = counts[np.newaxis] - one_hot
+    own = (others * one_hot).sum(axis=-1)
+    comparable = rated & (others.sum(axis=-1) > 0)
+    agree = (own == others.max(axis=-1)) & comparable
+
+    # alpha without each rater: only the coincidences of the subjects they rated change
+    per_subject = coincidences(counts)
+    o_all = per_subject.sum(axis=0)
+    r, s = np.nonzero(rated)
+    change = coincidences(counts[s] - one_hot[r, s]) - per_subject[s]
+    o_without = np.repeat(o_all[np.newaxis], ratings.shape[0], axis=0)
+    np.add.at(o_without, r, change)
+    alpha, alpha_without = coincidence_alpha(o_all, level), coincidence_alpha(o_without, level)
+
+    return pd.DataFrame({'n_items': rated.sum(axis=1),
+                         'loo_agreement': agree.sum(axis=1) / np.maximum(comparable.sum(axis=1), 1),
+                         'alpha_without': alpha_without,
+                         'alpha_contribution': alpha - alpha_without})
+
+
+def annotator_reliability(df: pd.DataFrame, labels: List[str], rater_col: str = 'User', subject_col: str = 'Question ID') -> pd.DataFrame:
+    """ Reliability of every annotator in each phase and label (rows of rater_col, phase, label), joinable to users """
+    ratings = phase_ratings(df, labels, rater_col, subject_col)
+    tables = []
+    for l in labels:
+        for p in PHASES:
+            level = 'ordinal' if '_bin' in l else 'nominal'
+            table = loo_reliability(ratings[(l, p)].values.astype(float), level)
+            table.insert(0, rater_col, ratings.index)
+            table.insert(1, 'phase', p)
+            table.insert(2, 'label', l)
+            tables.append(table)
+    reliability = pd.concat(tables, ignore_index=True)
+    # raters without ratings in a subset (e.g. after filtering df)
+    return reliability.loc[reliability['n_items'] > 0].reset_index(drop=True)
@@ -0,0 +1,147 @@
+import json, asyncio, argparse
+from functools import lru_cache
+from urllib.parse import urlsplit, parse_qsl
+from typing import Dict
+import pandas as pd
+
+import scripts.dataCollect as dc
+from scripts.agreement import agreement_table
+from scripts.helper import pearson_correlation, define_category
+
+
+#########################
+# Local query service (agreement, alignment and categories of any slice of the dataset)
+#########################
+
+# GET /agreement?group=gender&filter.subgroupA=S,G | POST /agreement {"group": "gender", "filter": {"subgroupA": ["S", "G"]}}
+QUERIES = ['agreement', 'alignment', 'categories']
+
+
+def normalize_query(kind: str, params: Dict) -> str:
+    """ Canonical JSON of a query: filters and list parameters sorted, so equivalent queries share a cache entry """
+    def canonical(value):
+        if isinstance(value, dict):
+            return {str(k): canonical(v) for k, v in value.items()}
+        if isinstance(value, (list, tuple)):
+            return sorted(str(v) for v in value)
+        if isinstance(value, bool):
+            # JSON true/false as in query strings
+            return str(value).lower()
+        return str(value)
+    return json.dumps({'query': kind, **canonical(params)}, sort_keys=True)
+
+
+def parse_params(query_string: str) -> Dict:
+    """ Query string to parameters: 'filter.{column}' entries into a filter dict, comma separated values into lists """
+    params = {}
+    for key, value in parse_qsl(query_string):
+        value = value.split(',') if ',' in value else value
+        if key.startswith('filter.') or key.startswith('source.') or key.startswith('target.'):
+            kind, column = key.split('.', 1)
+            params.setdefault(kind, {})[column] = value
+        else:
+            params[key] = value
+    return params
+
+
+class QueryService:
+    """ hateRep dataset loaded once, answering queries with an LRU cache of results """
+
+    def __init__(self, u_path: str, d_path: str, cache_size: int = 1024):
+        self.data, self.samples, self.users = dc.load_hateRep(u_path=u_path, d_path=d_path)
+        self.answer = lru_cache(maxsize=cache_size)(self._answer)
+
+    def select(self, filters: Dict) -> pd.DataFrame:
+        """ Rows of the dataset matching every {column: value or list of values} """
+        mask = pd.Series(True, index=self.data.index)
+        for col, values in (filters or {}).items():
+            values = values if isinstance(values, list) else [values]
+            # compare as text, values come from URLs or JSON
+            mask &= self.data[col].astype(str).isin(values)
+        return self.data.loc[mask]
+
+    def _answer(self, query: str) -> str:
+        """ JSON result of a normalized query """
+        params = json.loads(query)
+        kind = params.pop('query')
+        if kind == 'agreement':
+            result = self.agreement(**params)
+        elif kind == 'alignment':
+            result = self.alignment(**params)
+        elif kind == 'categories':
+            result = self.categories(**params)
+        else:
+            raise ValueError(f'Unknown query: {kind} (one of {QUERIES})')
+        return result.to_json(orient='split')
+
+    def agreement(self, group: str = None, labels=None, score: str = 'krippendorf', filter: Dict = None) -> pd.DataFrame:
+        """ Agreement of labels (or of a target group, or 'other') in each phase on the filtered annotations """
+        if labels is None:
+            labels = dc.TARGET_LABELS[group] if group in dc.TARGET_GROUPS else [f"{l}_bin" for l in dc.TARGET_GROUPS + dc.HATE_QS]
+        labels = labels if isinstance(labels, list) else [labels]
+        return agreement_table(self.select(filter), score, labels)
+
+    def alignment(self, label: str, source: Dict = None, target: Dict = None) -> pd.DataFrame:
+        """ Pearson correlation of a label between two filtered sets of annotators (e.g. source.group=nonLGBT, target.group=LGBT) """
+        src, tgt = self.select(source), self.select(target)
+        values = {p: pearson_correlation(src, tgt, f'{label}_{p}', 'Question ID') for p in dc.PHASES}
+        return pd.DataFrame(values, index=[label])
+
+    def categories(self, group: str, filter: Dict = None, normalize: str = 'false') -> pd.DataFrame:
+        """ Distribution of post categories (by agreement and decision on target group) in each phase """
+        subset = self.select(filter)
+        normalize = str(normalize).lower() == 'true'
+        values = {}
+        for p in dc.PHASES:
+            # quiet: queries run on worker threads sharing sys.stdout
+            types = pd.Series({id: define_category(x, f'{group}_cat_{p}', group, verbose=False) for id, x in subset.groupby('Question ID')})
+            values[p] = types.value_counts(normalize=normalize)
+        return pd.DataFrame(values).fillna(0)
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """ Minimal HTTP/1.1: GET with a query string or POST with a JSON body, on /{query} """
+        try:
+            request_line = (await reader.readline()).decode()
+            method, target, _ = request_line.split(' ', 2)
+            headers = {}
+            while (line := (await reader.readline()).decode().strip()):
+                name, value = line.split(':', 1)
+                headers[name.strip().lower()] = value.strip()
+            url = urlsplit(target)
+            params = parse_params(url.query)
+            if method == 'POST' and int(headers.get('content-length', 0)):
+                params.update(json.loads(await reader.readexactly(int(headers['content-length']))))
+            query = normalize_query(url.path.strip('/'), params)
+            # cached queries return immediately, the others run outside the event loop
+            body = await asyncio.get_running_loop().run_in_executor(None, self.answer, query)
+            status = '200 OK'
+        except Exception as e:
+            body, status = json.dumps({'error': repr(e)}), '400 Bad Request'
+        payload = body.encode()
+        writer.write(f'HTTP/1.1 {status}\r\nContent-Type: application/json\r\nContent-Length: {len(payload)}\r\nConnection: close\r\n\r\n'.encode() + payload)
+        await writer.drain()
+        writer.close()
+
+    async def serve(self, host: str = '127.0.0.1', port: int = 8765, unix: str = None):
+        """ Serve on a TCP port or a Unix socket until cancelled """
+        if unix:
+            server = await asyncio.start_unix_server(self.handle, path=unix)
+        else:
+            server = await asyncio.start_server(self.handle, host=host, port=port)
+        print(f'Serving hateRep queries on {unix or f"http://{host}:{port}"}')
+        async with server:
+            await server.serve_forever()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Local query service over the hateRep dataset')
+    parser.add_argument('--u_path', default='annotators')
+    parser.add_argument('--d_path', default='data')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--unix', default=None, help='Unix socket path (instead of host and port)')
+    parser.add_argument('--cache_size', type=int, default=1024)
+    args = parser.parse_args()
+
+    service = QueryService(args.u_path, args.d_path, cache_size=args.cache_size)
+    asyncio.run(service.serve(args.host, args.port, args.unix))
@@ -0,0 +1,59 @@
+import os
+from typing import Tuple
+import pandas as pd
+
+import scripts.dataCollect as dc
+
+
+#########################
+# Dataset shared between processes (Arrow IPC files, memory mapped)
+#########################
+
+TABLES = ['facts', 'posts', 'annotators']
+
+
+def publish_hateRep(facts: pd.DataFrame, posts: pd.DataFrame, annotators: pd.DataFrame, path: str):
+    """ Write the compact tables (from load_hateRep(compact=True)) as uncompressed Arrow IPC files in path """
+    import pyarrow as pa
+
+    os.makedirs(path, exist_ok=True)
+    for name, df in zip(TABLES, [facts, posts, annotators]):
+        # Prolific columns mixing numbers and text (e.g. 'Time taken' or 'DATA_EXPIRED') are stored as text
+        mixed = [c for c in df.columns if pd.api.types.infer_dtype(df[c]) in ['mixed-integer', 'mixed-integer-float']]
+        df = df.astype({c: str for c in mixed})
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        # write to a temporary file first so workers never attach to a half written table
+        tmp = os.path.join(path, f'.{name}.arrow')
+        with pa.OSFile(tmp, 'wb') as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(tmp, os.path.join(path, f'{name}.arrow'))
+
+
+def attach_table(path: str, name: str):
+    """ Read-only Arrow table backed by the memory map of a published file """
+    import pyarrow as pa
+
+    source = pa.memory_map(os.path.join(path, f'{name}.arrow'), 'r')
+    return pa.ipc.open_file(source).read_all()
+
+
+def attach_hateRep(path: str) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    """ Compact tables published in path; numeric columns of facts are views of the memory map, not copies """
+    import pyarrow as pa
+
+    tables = []
+    for name in TABLES:
+        table = attach_table(path, name)
+        # one block per column, otherwise pandas consolidates (copies) columns of the same dtype
+        df = table.to_pandas(split_blocks=True)
+        # arrow returns arrays for list columns (e.g. samples box_entity)
+        for c in [f.name for f in table.schema if pa.types.is_list(f.type)]:
+            df[c] = df[c].apply(list)
+        tables.append(df)
+    return tuple(tables)
+
+
+def attach_hateRep_data(path: str) -> pd.DataFrame:
+    """ Full dataset (load_hateRep layout) from the published tables """
+    return dc.expand_hateRep(*attach_hateRep(path))
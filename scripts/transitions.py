@@ -0,0 +1,59 @@
+from typing import List
+import pandas as pd
+
+import scripts.dataCollect as dc
+
+
+#########################
+# Category transitions between phases (from the {g}_types_{group}_{p} columns of samples)
+#########################
+
+# Labels of annotator groups in the overlap tables
+GROUP_TAGS = {'LGBT': 'S & G', 'nonLGBT': 'M & W'}
+
+def categorised_posts(samples: pd.DataFrame) -> pd.DataFrame:
+    """ Long table (Question ID, group, target, phase, category, decision) of every {g}_types_{group}_{p} column """
+    pattern = rf"^(?P<target>{'|'.join(dc.TARGET_GROUPS)})_types_(?P<group>.+)_(?P<phase>[^_]+)$"
+    cols = samples.columns[samples.columns.str.match(pattern)]
+    posts = samples[['Question ID'] + cols.to_list()].melt(id_vars='Question ID', var_name='column', value_name='category')
+    posts = pd.concat([posts, posts['column'].str.extract(pattern)], axis=1).drop(columns='column').dropna(subset=['category'])
+    # decision of the agreed categories (e.g. majority_targeting -> targeting), none if no agreement
+    posts['decision'] = posts['category'].str.extract(r'^(?:all|majority|opinions)_(.+)$', expand=False)
+    return posts[['Question ID', 'group', 'target', 'phase', 'category', 'decision']].reset_index(drop=True)
+
+
+def transition_tensor(posts: pd.DataFrame, order: List[str], first: str = None, last: str = None) -> pd.Series:
+    """ Number of posts by (group, target, from, to) category between two phases, with every category in order """
+    first, last = first or dc.PHASES[0], last or dc.PHASES[-1]
+    phases = posts.loc[posts['phase'].isin([first, last])]
+    phases = phases.pivot(index=['group', 'target', 'Question ID'], columns='phase', values='category').dropna()
+    counts = phases.groupby(['group', 'target', first, last]).size()
+    full = pd.MultiIndex.from_product([counts.index.levels[0], counts.index.levels[1], order, order], names=['group', 'target', 'from', 'to'])
+    counts.index.names = full.names
+    return counts.reindex(full, fill_value=0)
+
+
+def phase_frequencies(tensor: pd.Series, group: str, target: str):
+    """ Percentage of posts in each category in the first (from) and last (to) phase """
+    counts = tensor.loc[(group, target)].unstack('to')
+    return counts.sum(axis=1) / counts.values.sum() * 100, counts.sum(axis=0) / counts.values.sum() * 100
+
+
+def flips(posts: pd.DataFrame, group: str, target: str, from_decision: str = 'not-targeting', to_decision: str = 'targeting',
+          first: str = None, last: str = None) -> List[int]:
+    """ IDs of posts with an agreed decision (all, majority or opinions) that changed between two phases """
+    first, last = first or dc.PHASES[0], last or dc.PHASES[-1]
+    subset = posts.loc[(posts['group'] == group) & (posts['target'] == target)]
+    decisions = subset.pivot(index='Question ID', columns='phase', values='decision')
+    return decisions.index[(decisions[first] == from_decision) & (decisions[last] == to_decision)].to_list()
+
+
+def overlap_counts(posts: pd.DataFrame, target: str, phase: str, order: List[str], group1: str = 'LGBT', group2: str = 'nonLGBT') -> pd.DataFrame:
+    """ Posts in each category for both groups, or only one of them, in a phase (rows: both, group tags) """
+    subset = posts.loc[(posts['target'] == target) & (posts['phase'] == phase)]
+    # posts categorised by both groups
+    categories = subset.pivot(index='Question ID', columns='group', values='category')[[group1, group2]].dropna()
+    both = categories.loc[categories[group1] == categories[group2], group1].value_counts().reindex(order, fill_value=0)
+    counts_1 = categories[group1].value_counts().reindex(order, fill_value=0) - both
+    counts_2 = categories[group2].value_counts().reindex(order, fill_value=0) - both
+    return pd.DataFrame([both, counts_1, counts_2], index=['both', GROUP_TAGS[group1], GROUP_TAGS[group2]], columns=order)
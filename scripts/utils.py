@@ -157,9 +157,14 @@ def export_frequency_plot(df:pd.DataFrame, col1:str, col2:str, order:List[str],
     """ Horizontal bar matplolib plot """
     # Calculate frequencies
     freq_col1 = df[col1].value_counts(normalize=True) * 100
-    sorted_freq1 = freq_col1.reindex(order, fill_value=0)
     # print(freq_col1.sum())
     freq_col2 = df[col2].value_counts(normalize=True) * 100
+    plot_frequencies(freq_col1, freq_col2, order, labels_type, pdf_filename)
+
+
+def plot_frequencies(freq_col1: pd.Series, freq_col2: pd.Series, order: List[str], labels_type: str, pdf_filename: str):
+    """ Horizontal bar matplolib plot of category percentages in the first and last phase """
+    sorted_freq1 = freq_col1.reindex(order, fill_value=0)
     sorted_freq2 = freq_col2.reindex(order, fill_value=0)
 
     # Create the plot
@@ -313,7 +318,11 @@ def export_overlap_count(df: pd.DataFrame, col1: str, col2: str, order: List[str
 
     col1_tag, col2_tag = ['S & G' if 'LGBT' in col1 else 'M & W'][0], ['M & W' if 'nonLGBT' in col2 else 'S and G'][0]
     counts_matrix = pd.DataFrame(data=[both_values, col1_values, col2_values], columns=order, index=['both', col1_tag, col2_tag])
+    plot_overlap(counts_matrix, labels_type, pdf_filename)
+
 
+def plot_overlap(counts_matrix: pd.DataFrame, labels_type: str, pdf_filename: str):
+    """ Heatmap of counts by category (rows) in both groups or only in one of them (columns) """
     # Create a heatmap using seaborn
     draw_heatmap(counts_matrix.T, pdf_filename, figsize=(5, 4), title=labels_type, vmax=60)
 